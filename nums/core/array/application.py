@@ -563,9 +563,13 @@ class ArrayApplication:
         return result
 
     def sqrt(self, X: BlockArray) -> BlockArray:
-        if X.dtype not in (float, np.float32, np.float64):
-            X = X.astype(np.float64)
-        return X.ufunc("sqrt")
+        if X.dtype in (float, np.float32, np.float64):
+            return X.ufunc("sqrt")
+        if any(np.issubdtype(X.dtype, t) for t in (np.bool_, np.integer, np.floating)):
+            # Cast within the ufunc loop rather than materializing a float64 copy of X.
+            return self.map_uop("sqrt", X, kwargs={"dtype": np.float64})
+        # The ufunc loop cannot cast other dtypes, such as complex, to float64.
+        return X.astype(np.float64).ufunc("sqrt")
 
     def norm(self, X: BlockArray, order=2) -> BlockArray:
         assert len(X.shape) == 1, "Only vector norms are supported."
@@ -894,7 +898,10 @@ class ArrayApplication:
         kwargs = {} if kwargs is None else kwargs
         shape = arr.shape
         block_shape = arr.block_shape
-        dtype = array_utils.get_uop_output_type(op_name, arr.dtype)
+        if "dtype" in kwargs:
+            dtype = kwargs["dtype"]
+        else:
+            dtype = array_utils.get_uop_output_type(op_name, arr.dtype)
         assert len(shape) == len(block_shape)
         if out is None:
             grid = ArrayGrid(shape, block_shape, dtype.__name__)
@@ -146,9 +146,13 @@ class Block:
     def uop_map(self, op_name, args=None, kwargs=None, device=None):
         # This retains transpose.
         block = self.copy()
-        block.dtype = array_utils.get_uop_output_type(op_name, self.dtype)
         args = () if args is None else args
         kwargs = {} if kwargs is None else kwargs
+        if "dtype" in kwargs:
+            # The op casts to dtype within its loop.
+            block.dtype = kwargs["dtype"]
+        else:
+            block.dtype = array_utils.get_uop_output_type(op_name, self.dtype)
         if device is None:
             syskwargs = {"grid_entry": block.grid_entry, "grid_shape": block.grid_shape}
         else:
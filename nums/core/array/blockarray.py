@@ -1237,8 +1237,14 @@ class Reshape:
                     "grid_entry": dst_grid_entry,
                     "grid_shape": dst_arr.grid.grid_shape,
                 }
+                # dst_arr is created above and its blocks are not shared,
+                # so blocks can be updated in-place.
                 dst_block.oid = km.update_block_by_index(
-                    dst_block.oid, src_block.oid, index_pairs, syskwargs=syskwargs
+                    dst_block.oid,
+                    src_block.oid,
+                    index_pairs,
+                    inplace=True,
+                    syskwargs=syskwargs,
                 )
         return dst_arr
 
@@ -13,10 +13,14 @@
 # limitations under the License.
 from dataclasses import dataclass
 from itertools import repeat
+import pickle
+import sys
 from types import FunctionType
 from typing import Any, List, Dict, Union
 import warnings
 
+import numpy as np
+
 from nums.core.grid.grid import Device
 
 from .base import Backend
@@ -25,14 +29,98 @@ from .utils import get_private_ip
 
 @dataclass
 class MPIRemoteObj:
+    # MPI objects are created for every block and call result,
+    # so attributes are stored in slots instead of an instance dict.
+    __slots__ = ("rank",)
     rank: int
 
 
 @dataclass
 class MPILocalObj:
+    __slots__ = ("value",)
     value: Any
 
 
+@dataclass
+class MPIArrayHeader:
+    # Sent in place of a NumPy array, whose buffer is sent in a separate message.
+    __slots__ = ("shape", "dtype")
+    shape: tuple
+    dtype: np.dtype
+
+
+@dataclass
+class MPIPendingRecv:
+    # Placeholder for a call argument sent by rank, whose receive is not yet posted.
+    __slots__ = ("rank",)
+    rank: int
+
+
+# Alignment of frames within a serialized payload.
+FRAME_ALIGNMENT = 64
+
+
+def _frame_offsets(sizes: np.ndarray) -> np.ndarray:
+    # Frames follow a header which holds the number of frames and their sizes.
+    # Each frame starts on an aligned offset. The last offset is the payload size.
+    sizes = np.concatenate([[(len(sizes) + 1) * 8], sizes])
+    padded = -(-sizes // FRAME_ALIGNMENT) * FRAME_ALIGNMENT
+    offsets = np.cumsum(padded)
+    offsets[-1] += sizes[-1] - padded[-1]
+    return offsets
+
+
+def serialize(value: Any) -> List[memoryview]:
+    """
+    Serialize value into frames, with pickle protocol 5.
+    The first frame is the pickle stream.
+    The remaining frames are contiguous NumPy array buffers, which are not copied.
+    Before Python 3.8, value is pickled in-band with protocol 4, into a single frame.
+    """
+    if sys.version_info < (3, 8):
+        return [memoryview(pickle.dumps(value, protocol=4))]
+    buffers = []
+    data = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+    return [memoryview(data)] + [buffer.raw() for buffer in buffers]
+
+
+def payload_nbytes(frames: List[memoryview]) -> int:
+    sizes = np.array([frame.nbytes for frame in frames], dtype=np.int64)
+    return int(_frame_offsets(sizes)[-1])
+
+
+def pack(frames: List[memoryview], payload):
+    """
+    Write frames to payload, which must be at least payload_nbytes(frames) bytes.
+    """
+    payload = memoryview(payload).cast("B")
+    sizes = np.array([frame.nbytes for frame in frames], dtype=np.int64)
+    header = np.concatenate([[len(frames)], sizes]).astype(np.int64)
+    payload[: header.nbytes] = header.tobytes()
+    for offset, frame in zip(_frame_offsets(sizes), frames):
+        payload[offset : offset + frame.nbytes] = frame.cast("B")
+
+
+def deserialize(payload, copy: bool = False) -> Any:
+    """
+    Deserialize a payload written by pack.
+    Unless copy is True, NumPy arrays stored out-of-band are views of payload.
+    """
+    payload = memoryview(payload).cast("B")
+    num_frames = int(np.frombuffer(payload, dtype=np.int64, count=1)[0])
+    sizes = np.frombuffer(payload, dtype=np.int64, count=num_frames, offset=8)
+    frames = [
+        payload[offset : offset + size]
+        for offset, size in zip(_frame_offsets(sizes), sizes)
+    ]
+    if num_frames == 1:
+        return pickle.loads(frames[0])
+    buffers = frames[1:]
+    if copy:
+        buffers = [bytearray(buffer) for buffer in buffers]
+    return pickle.loads(frames[0], buffers=buffers)
+
+
 class MPIBackend(Backend):
     """
     Implements backend for MPI.
@@ -42,9 +130,24 @@ class MPIBackend(Backend):
         # pylint: disable=import-outside-toplevel c-extension-no-member import-error
         from mpi4py import MPI
 
+        self._MPI = MPI
         self.comm = MPI.COMM_WORLD
         self.size = self.comm.Get_size()
         self.rank = self.comm.Get_rank()
+        # Ranks which can share memory with this rank.
+        self.node_comm = self.comm.Split_type(MPI.COMM_TYPE_SHARED)
+        self.node_rank = self.node_comm.Get_rank()
+        self.is_node_leader = self.node_rank == 0
+        # Rank in node_comm of each world rank, or MPI.UNDEFINED for ranks on other nodes.
+        world_group = self.comm.Get_group()
+        node_group = self.node_comm.Get_group()
+        self._world_to_node_rank = MPI.Group.Translate_ranks(
+            world_group, list(range(self.size)), node_group
+        )
+        world_group.Free()
+        node_group.Free()
+        # Broadcast through a shared memory window if all ranks are on one node.
+        self._shared_memory = self.node_comm.Get_size() == self.size
         self.proc_name: str = get_private_ip()
 
         self._devices: List[Device] = []
@@ -59,19 +162,39 @@ class MPIBackend(Backend):
         self._actor_to_rank: dict = {}
         self._actor_node_index = 0
 
+        # Resolve call dependencies with non-blocking sends and receives.
+        self._async = True
+        # NumPy arrays with these dtypes are transferred through the buffer interface.
+        self._numpy_to_mpi = {
+            np.dtype(np.bool_): MPI.C_BOOL,
+            np.dtype(np.int32): MPI.INT32_T,
+            np.dtype(np.int64): MPI.INT64_T,
+            np.dtype(np.float32): MPI.FLOAT,
+            np.dtype(np.float64): MPI.DOUBLE,
+            np.dtype(np.complex64): MPI.C_FLOAT_COMPLEX,
+            np.dtype(np.complex128): MPI.C_DOUBLE_COMPLEX,
+        }
+        # Tags of messages holding pickled objects and array buffers, respectively.
+        self._object_tag = 0
+        self._buffer_tag = 1
+        # Non-blocking array buffer sends, which are completed separately
+        # because they carry no pickled result.
+        self._buffer_send_requests: list = []
+
     def init(self):
         self.init_devices()
 
     def init_devices(self):
-        # TODO: sort proc_names and don't do an all-gather for `did`. Construct `did` locally.
-        proc_names = list(set(self.comm.allgather(self.proc_name)))
-        did = Device(proc_names.index(self.proc_name), self.proc_name, "cpu", self.rank)
-        self._device_to_rank[did] = self.rank
-        self._devices = self.comm.allgather(did)
-        self._device_to_rank = self.comm.allgather({did: self.rank})
-        self._device_to_rank = dict(
-            (key, val) for k in self._device_to_rank for key, val in k.items()
-        )
+        # Gather processor names once, and construct all devices locally.
+        # Node ids are assigned in sorted order of processor names,
+        # so that every rank assigns the same node id to each device.
+        proc_names = self.comm.allgather(self.proc_name)
+        _, node_ids = np.unique(proc_names, return_inverse=True)
+        self._devices = [
+            Device(int(node_ids[rank]), proc_names[rank], "cpu", rank)
+            for rank in range(self.size)
+        ]
+        self._device_to_rank = {did: did.device for did in self._devices}
 
     def shutdown(self):
         pass
@@ -86,31 +209,87 @@ class MPIBackend(Backend):
             return MPIRemoteObj(dest_rank)
 
     def get(self, object_ids: Union[Any, List]):
-        resolved_object_ids = []
-        if not isinstance(object_ids, (MPIRemoteObj, MPILocalObj)):
-            for obj in object_ids:
-                if isinstance(obj, MPIRemoteObj):
-                    dest_rank = obj.rank
+        if isinstance(object_ids, (MPIRemoteObj, MPILocalObj)):
+            return self._bcast_many([object_ids])[0]
+        return self._bcast_many(object_ids)
+
+    def _bcast_many(self, objs: List) -> List:
+        # Broadcast the values of objs to all ranks.
+        # Objects are grouped by the rank which stores them,
+        # so that a single broadcast is issued per root rank instead of per object.
+        # Grouping with a dict of lists is faster than sorting ranks with NumPy
+        # for the number of objects typically fetched at once.
+        root_to_indices: Dict[int, List[int]] = {}
+        for i, obj in enumerate(objs):
+            if isinstance(obj, MPIRemoteObj):
+                root = obj.rank
+            else:
                 # This should be true for just one rank which has the data.
-                else:
-                    dest_rank = self.rank
-                # TODO: see if all-2-all might be more efficient.
-                obj = self.comm.bcast(obj, root=dest_rank)
-                obj_value = obj.value
-                assert not isinstance(obj_value, (MPILocalObj, MPIRemoteObj))
-                resolved_object_ids.append(obj_value)
-            return resolved_object_ids
+                root = self.rank
+            root_to_indices.setdefault(root, []).append(i)
+
+        frames = []
+        if self.rank in root_to_indices:
+            root_values = [objs[i].value for i in root_to_indices[self.rank]]
+            frames = serialize(root_values)
+        roots = sorted(root_to_indices)
+        shared = self._shared_memory
+        if shared:
+            root_payloads = self._bcast_payloads_shared(frames, roots)
         else:
-            obj = object_ids
-            if isinstance(obj, MPIRemoteObj):
-                dest_rank = obj.rank
-            # This should be true for just one rank which has the data.
+            root_payloads = self._bcast_payloads(frames, roots)
+
+        values = [None] * len(objs)
+        for root, root_payload in root_payloads:
+            if root == self.rank:
+                root_values = [objs[i].value for i in root_to_indices[root]]
             else:
-                dest_rank = self.rank
-            # TODO: see if all-2-all might be more efficient.
-            obj = self.comm.bcast(obj, root=dest_rank)
-            assert not isinstance(obj.value, (MPILocalObj, MPIRemoteObj))
-            return obj.value
+                # Payloads in shared memory are released after they are read.
+                root_values = deserialize(root_payload, copy=shared)
+            for i, value in zip(root_to_indices[root], root_values):
+                assert not isinstance(value, (MPILocalObj, MPIRemoteObj))
+                values[i] = value
+        return values
+
+    def _bcast_payloads(self, frames: List[memoryview], roots: List[int]):
+        # Yield (root, payload) pairs, in the order in which the payloads arrive.
+        # Exchange the size of every root's payload in a single collective.
+        size = payload_nbytes(frames) if frames else 0
+        sizes = np.empty(self.size, dtype=np.int64)
+        self.comm.Allgather(np.array([size], dtype=np.int64), sizes)
+        # Start all broadcasts, in the same order on every rank.
+        buffers = []
+        requests = []
+        for root in roots:
+            buffer = np.empty(sizes[root], dtype=np.uint8)
+            if root == self.rank:
+                pack(frames, buffer)
+            buffers.append(buffer)
+            requests.append(self.comm.Ibcast([buffer, self._MPI.BYTE], root=root))
+        for _ in roots:
+            j = self._MPI.Request.Waitany(requests)
+            yield roots[j], buffers[j]
+
+    def _bcast_payloads_shared(self, frames: List[memoryview], roots: List[int]):
+        # All ranks share memory, so every rank writes its payload to a shared window
+        # and reads the payloads of other ranks from the window,
+        # instead of copying them through the network stack.
+        size = payload_nbytes(frames) if frames else 0
+        win = self._MPI.Win.Allocate_shared(size, 1, comm=self.node_comm)
+        win.Lock_all(self._MPI.MODE_NOCHECK)
+        if frames:
+            buffer, _ = win.Shared_query(self.node_rank)
+            pack(frames, buffer)
+        win.Sync()
+        self.node_comm.Barrier()
+        win.Sync()
+        try:
+            for root in roots:
+                buffer, _ = win.Shared_query(self._world_to_node_rank[root])
+                yield root, memoryview(buffer)
+        finally:
+            win.Unlock_all()
+            win.Free()
 
     def remote(self, function: FunctionType, remote_params: dict):
         return function, remote_params
@@ -141,8 +320,9 @@ class MPIBackend(Backend):
         for arg in args:
             if isinstance(arg, MPILocalObj):
                 assert not isinstance(arg.value, MPILocalObj)
-        resolved_args = self._resolve_args(args, dest_rank)
-        resolved_kwargs = self._resolve_kwargs(kwargs, dest_rank)
+        resolved_args, resolved_kwargs = self._resolve_call_args(
+            args, kwargs, dest_rank
+        )
         func, nout = self._parse_call(name, options)
         if dest_rank == self.rank:
             result = func(*resolved_args, **resolved_kwargs)
@@ -156,45 +336,160 @@ class MPIBackend(Backend):
             else:
                 return MPIRemoteObj(dest_rank)
 
-    def _resolve_kwargs(self, kwargs: dict, device_rank):
+    def _resolve_call_args(self, args, kwargs: dict, device_rank):
+        requests = [] if self._async else None
+        resolved_args = self._resolve_args(args, device_rank, requests)
+        resolved_kwargs = self._resolve_kwargs(kwargs, device_rank, requests)
+        if requests:
+            self._wait_requests(requests, resolved_args, resolved_kwargs)
+        if self._buffer_send_requests:
+            self._MPI.Request.Waitall(self._buffer_send_requests)
+            self._buffer_send_requests = []
+        return resolved_args, resolved_kwargs
+
+    def _resolve_kwargs(self, kwargs: dict, device_rank, requests: List = None):
         # Resolve dependencies: iterate over kwargs and figure out which ones need fetching.
         assert isinstance(kwargs, dict), str(type(kwargs))
-        resolved_args = {}
-        for k, v in kwargs.items():
-            resolved_args[k] = self._resolve_object(v, device_rank)
-        return resolved_args
+        resolve_object = self._resolve_object
+        return {k: resolve_object(v, device_rank, requests) for k, v in kwargs.items()}
 
-    def _resolve_args(self, args: Union[list, tuple], device_rank):
+    def _resolve_args(
+        self, args: Union[list, tuple], device_rank, requests: List = None
+    ):
         # Resolve dependencies: iterate over args and figure out which ones need fetching.
         assert isinstance(args, (list, tuple)), str(type(args))
-        resolved_args = []
-        for arg in args:
-            resolved_arg = self._resolve_object(arg, device_rank)
-            resolved_args.append(resolved_arg)
-        return resolved_args
+        resolve_object = self._resolve_object
+        return [resolve_object(arg, device_rank, requests) for arg in args]
 
-    def _resolve_object(self, obj, device_rank):
-        if not isinstance(obj, (MPIRemoteObj, MPILocalObj)):
+    def _resolve_object(self, obj, device_rank, requests: List = None):
+        # If requests is not None, transfers are posted as non-blocking operations,
+        # and their requests are appended to requests.
+        # A pending receive is returned in place of the value it will hold,
+        # and is posted by _wait_requests.
+        # MPI objects are never subclassed, so exact type checks suffice.
+        obj_type = type(obj)
+        if obj_type is not MPILocalObj and obj_type is not MPIRemoteObj:
             return obj
         if device_rank == self.rank:
-            if isinstance(obj, MPILocalObj):
+            if obj_type is MPILocalObj:
                 # If the obj is local then just return the value.
                 return obj.value
             # If the object is not local then execute a receive.
             sender_rank = obj.rank
-            # TODO: Try Isend and Irecv and have a switch for sync and async.
-            arg_value = self.comm.recv(source=sender_rank)
-            return arg_value
-        elif isinstance(obj, MPILocalObj):
+            if requests is None:
+                value = self.comm.recv(source=sender_rank, tag=self._object_tag)
+                if isinstance(value, MPIArrayHeader):
+                    value = self._recv_array(value, sender_rank)
+                return value
+            pending = MPIPendingRecv(sender_rank)
+            requests.append(pending)
+            return pending
+        elif obj_type is MPILocalObj:
             # The obj is stored on this rank, so send it to the device on which the op will be
             # executed.
-            self.comm.send(obj.value, dest=device_rank)
+            self._send_value(obj.value, device_rank, requests)
             return obj
         else:
             # The obj is remote and this is not the device on which we want to invoke the op.
             # Because the obj is remote, this is not the sender.
             return obj
 
+    def _send_value(self, value, dest_rank, requests: List = None):
+        # Contiguous NumPy arrays are sent as a header followed by the raw buffer,
+        # which avoids pickling the array. All other values are pickled.
+        mpi_dtype = None
+        # Subclasses such as masked arrays are pickled,
+        # because the receiver reconstructs a base ndarray from the header.
+        # pylint: disable=unidiomatic-typecheck
+        if type(value) is np.ndarray and value.flags.c_contiguous:
+            mpi_dtype = self._numpy_to_mpi.get(value.dtype)
+        if mpi_dtype is None:
+            if requests is None:
+                self.comm.send(value, dest=dest_rank, tag=self._object_tag)
+            else:
+                requests.append(
+                    self.comm.isend(value, dest=dest_rank, tag=self._object_tag)
+                )
+            return
+        header = MPIArrayHeader(value.shape, value.dtype)
+        if requests is None:
+            self.comm.send(header, dest=dest_rank, tag=self._object_tag)
+            self.comm.Send([value, mpi_dtype], dest=dest_rank, tag=self._buffer_tag)
+        else:
+            requests.append(
+                self.comm.isend(header, dest=dest_rank, tag=self._object_tag)
+            )
+            self._buffer_send_requests.append(
+                self.comm.Isend(
+                    [value, mpi_dtype], dest=dest_rank, tag=self._buffer_tag
+                )
+            )
+
+    def _recv_array(self, header: MPIArrayHeader, sender_rank):
+        value = np.empty(header.shape, dtype=header.dtype)
+        self.comm.Recv(
+            [value, self._numpy_to_mpi[header.dtype]],
+            source=sender_rank,
+            tag=self._buffer_tag,
+        )
+        return value
+
+    def _wait_requests(
+        self, requests: List, resolved_args: List, resolved_kwargs: dict
+    ):
+        # Complete all pending transfers, and replace pending receives with their values.
+        # Messages between a pair of ranks are matched in the order they are posted,
+        # so no additional synchronization is required.
+        send_requests = []
+        source_to_pending: Dict[int, List[MPIPendingRecv]] = {}
+        for request in requests:
+            if isinstance(request, MPIPendingRecv):
+                source_to_pending.setdefault(request.rank, []).append(request)
+            else:
+                send_requests.append(request)
+        # Match each message with a non-blocking probe before receiving it,
+        # so that the receive is sized to the message.
+        # A buffer-less irecv receives into a fixed-size buffer.
+        # Probing every sender in turn posts receives in the order messages arrive.
+        pending = []
+        recv_requests = []
+        while source_to_pending:
+            for source in list(source_to_pending):
+                message = self.comm.improbe(source=source, tag=self._object_tag)
+                if message is None:
+                    continue
+                pending.append(source_to_pending[source].pop(0))
+                recv_requests.append(message.irecv())
+                if not source_to_pending[source]:
+                    del source_to_pending[source]
+        statuses = [self._MPI.Status() for _ in recv_requests]
+        results = self._MPI.Request.waitall(recv_requests, statuses)
+        if send_requests:
+            self._MPI.Request.waitall(send_requests)
+        received = {}
+        buffer_requests = []
+        for request, result, status in zip(pending, results, statuses):
+            if isinstance(result, MPIArrayHeader):
+                # Post buffer receives in the same order the sender posted its buffer sends.
+                value = np.empty(result.shape, dtype=result.dtype)
+                buffer_requests.append(
+                    self.comm.Irecv(
+                        [value, self._numpy_to_mpi[result.dtype]],
+                        source=status.Get_source(),
+                        tag=self._buffer_tag,
+                    )
+                )
+                result = value
+            received[id(request)] = result
+        if buffer_requests:
+            self._MPI.Request.Waitall(buffer_requests)
+        for i, arg in enumerate(resolved_args):
+            if isinstance(arg, MPIPendingRecv):
+                resolved_args[i] = received[id(arg)]
+        for k, v in resolved_kwargs.items():
+            if isinstance(v, MPIPendingRecv):
+                resolved_kwargs[k] = received[id(v)]
+
     def register_actor(self, name: str, cls: type):
         if name in self._actors:
             warnings.warn(
@@ -211,8 +506,9 @@ class MPIBackend(Backend):
             self._actor_node_index = (self._actor_node_index + 1) % len(self._devices)
         actor = self._actors[name]
         dest_rank = self._device_to_rank[device]
-        resolved_args = self._resolve_args(args, dest_rank)
-        resolved_kwargs = self._resolve_kwargs(kwargs, dest_rank)
+        resolved_args, resolved_kwargs = self._resolve_call_args(
+            args, kwargs, dest_rank
+        )
         if dest_rank == self.rank:
             actor_obj = actor(*resolved_args, **resolved_kwargs)
             actor_id = id(actor_obj)
@@ -227,8 +523,9 @@ class MPIBackend(Backend):
     def call_actor_method(self, actor, method: str, *args, **kwargs):
         dest_rank = self._actor_to_rank[id(actor)]
         # Resolve args.
-        resolved_args = self._resolve_args(args, dest_rank)
-        resolved_kwargs = self._resolve_kwargs(kwargs, dest_rank)
+        resolved_args, resolved_kwargs = self._resolve_call_args(
+            args, kwargs, dest_rank
+        )
         # Make sure it gets called on the correct rank.
         if not isinstance(actor, MPIRemoteObj):
             return getattr(actor, method)(*resolved_args, **resolved_kwargs)
@@ -16,6 +16,7 @@ import logging
 from types import FunctionType
 from typing import Any, List, Dict, Optional
 
+import numpy as np
 import ray
 
 from nums.core import settings
@@ -24,6 +25,14 @@ from nums.core.grid.grid import Device
 from .base import Backend
 from .utils import get_private_ip, get_num_cores
 
+# Amount of a node's custom resource requested by each task and actor,
+# which pins it to the node without limiting how many run concurrently.
+NODE_RESOURCE_WEIGHT = 1.0 / 10**4
+
+
+def _identity(value):
+    return value
+
 
 class RayBackend(Backend):
     # pylint: disable=abstract-method
@@ -45,12 +54,24 @@ class RayBackend(Backend):
         self._manage_ray = True
         self._remote_functions = {}
         self._actors: dict = {}
+        # Remote functions and actor classes with options applied.
+        # Applying options creates a new wrapper, so wrappers are reused across calls.
+        self._options_cache: dict = {}
+        self._actor_options_cache: dict = {}
         self._actor_node_index = 0
         self._available_nodes = []
         self._head_node = None
         self._worker_nodes = []
         self._devices: List[Device] = []
         self._device_to_node: Dict[Device, Dict] = {}
+        self._node_keys: Dict[str, str] = {}
+        self._device_node_key: Dict[Device, str] = {}
+        self._node_resources: Dict[str, Dict[str, float]] = {}
+        self._num_cores_total = 0
+        self._driver_ip = None
+        self._driver_devices = set()
+        self._identity_remote = None
+        self._device_identity: Dict[Device, Any] = {}
 
     def init(self):
         if ray.is_initialized():
@@ -60,23 +81,29 @@ class RayBackend(Backend):
                 ray.init(num_cpus=self.num_cpus)
             else:
                 ray.init(address=self._address)
+        # Places values on nodes. It requires no CPU, so it never waits on running tasks.
+        self._identity_remote = ray.remote(num_cpus=0)(_identity)
         # Compute available nodes, based on CPU resource.
+        self._driver_ip = get_private_ip()
         if settings.head_ip is None:
             # TODO (hme): Have this be a class argument vs. using what's set in settings directly.
             logging.getLogger(__name__).info("Using driver node ip as head node.")
-            head_ip = get_private_ip()
+            head_ip = self._driver_ip
         else:
             head_ip = settings.head_ip
         total_cpus = 0
-        nodes = ray.nodes()
-        for node in nodes:
-            node_ip = self._node_ip(node)
+        # Parse each node's resources once.
+        node_records = [
+            (node, self._node_ip(node), self._node_cpu_resources(node))
+            for node in ray.nodes()
+        ]
+        for node, node_ip, node_cpus in node_records:
             if head_ip == node_ip:
                 logging.getLogger(__name__).info("head node %s", node_ip)
                 self._head_node = node
-            elif self._has_cpu_resources(node):
+            elif node_cpus > 0.0:
                 logging.getLogger(__name__).info("worker node %s", node_ip)
-                total_cpus += node["Resources"]["CPU"]
+                total_cpus += node_cpus
                 self._worker_nodes.append(node)
                 self._available_nodes.append(node)
         if self._head_node is None:
@@ -105,6 +132,28 @@ class RayBackend(Backend):
             did = Device(node_id, self._node_key(node), "cpu", 0)
             self._devices.append(did)
             self._device_to_node[did] = node
+        # Precompute per-device values which are needed on every call.
+        self._device_node_key = {
+            did: self._node_key(node) for did, node in self._device_to_node.items()
+        }
+        self._node_resources = {
+            node_key: {node_key: NODE_RESOURCE_WEIGHT}
+            for node_key in self._device_node_key.values()
+        }
+        self._num_cores_total = int(
+            sum(node["Resources"]["CPU"] for node in self._device_to_node.values())
+        )
+        self._driver_devices = {
+            did
+            for did, node in self._device_to_node.items()
+            if self._node_ip(node) == self._driver_ip
+        }
+        self._device_identity = {
+            did: self._identity_remote.options(
+                resources=self._node_resources[self._device_node_key[did]]
+            )
+            for did in self._devices
+        }
 
     def _has_cpu_resources(self, node: dict) -> bool:
         return self._node_cpu_resources(node) > 0.0
@@ -113,9 +162,16 @@ class RayBackend(Backend):
         return node["Resources"]["CPU"] if "CPU" in node["Resources"] else 0.0
 
     def _node_key(self, node: dict) -> str:
-        node_key = list(filter(lambda key: "node" in key, node["Resources"].keys()))
-        assert len(node_key) == 1
-        return node_key[0]
+        # Node keys are cached by node id, since node dicts are not retained for all nodes.
+        node_id = node.get("NodeID")
+        node_key = self._node_keys.get(node_id)
+        if node_key is None:
+            node_keys = [key for key in node["Resources"] if "node" in key]
+            assert len(node_keys) == 1
+            node_key = node_keys[0]
+            if node_id is not None:
+                self._node_keys[node_id] = node_key
+        return node_key
 
     def _node_ip(self, node: dict) -> str:
         return self._node_key(node).split(":")[1]
@@ -130,28 +186,32 @@ class RayBackend(Backend):
             assert n < 10**6
 
             def warmup_func(n):
-                # pylint: disable=import-outside-toplevel
-                import random
-
                 r = ray.remote(num_cpus=1)(lambda x, y: x + y).remote
 
                 num_devices = len(self._devices)
+                a = np.random.randint(0, 1000, size=n)
+                b = np.random.randint(0, 1000, size=n)
+                # Submit all tasks before waiting on any of them.
+                object_ids = []
                 for i in range(n):
-                    _a = random.randint(0, 1000)
-                    _b = random.randint(0, 1000)
                     d0 = i % num_devices
                     d1 = (i + 1) % num_devices
-                    _v = self.get(
+                    object_ids.append(
                         r(
-                            self.put(_a, self._devices[d0]),
-                            self.put(_b, self._devices[d1]),
+                            self.put(a[i], self._devices[d0]),
+                            self.put(b[i], self._devices[d1]),
                         )
                     )
+                self.get(object_ids)
 
             warmup_func(n)
 
     def put(self, value: Any, device: Device):
-        return self.call("identity", [value], {}, device, {})
+        if device in self._driver_devices:
+            # Objects put by the driver are stored on the driver's node,
+            # so no task is needed to place the value on the device's node.
+            return ray.put(value)
+        return self._device_identity[device].remote(value)
 
     def get(self, object_ids):
         return ray.get(object_ids)
@@ -166,22 +226,33 @@ class RayBackend(Backend):
         self._remote_functions[name] = self.remote(func, remote_params)
 
     def call(self, name: str, args, kwargs, device: Device, options: Dict):
+        # Tasks are submitted eagerly. Callers expect object refs they can pass on immediately,
+        # and batching calls into a single task would execute them serially on one worker.
         if device is not None:
-            node = self._device_to_node[device]
-            node_key = self._node_key(node)
+            node_key = self._device_node_key[device]
             if "resources" in options:
                 assert node_key not in options
-            options["resources"] = {node_key: 1.0 / 10**4}
+            # Resources are overwritten below, so they are not part of the key.
+            key = (
+                name,
+                node_key,
+                tuple(
+                    sorted(item for item in options.items() if item[0] != "resources")
+                ),
+            )
+            remote_function = self._options_cache.get(key)
+            if remote_function is None:
+                options["resources"] = self._node_resources[node_key]
+                remote_function = self._remote_functions[name].options(**options)
+                self._options_cache[key] = remote_function
+            return remote_function.remote(*args, **kwargs)
         return self._remote_functions[name].options(**options).remote(*args, **kwargs)
 
     def devices(self) -> List[Device]:
         return self._devices
 
     def num_cores_total(self) -> int:
-        num_cores = sum(
-            map(lambda n: n["Resources"]["CPU"], self._device_to_node.values())
-        )
-        return int(num_cores)
+        return self._num_cores_total
 
     def register_actor(self, name: str, cls: type):
         if name in self._actors:
@@ -197,11 +268,14 @@ class RayBackend(Backend):
         if device is None:
             device = self._devices[self._actor_node_index]
             self._actor_node_index = (self._actor_node_index + 1) % len(self._devices)
-        actor = self._actors[name]
-        node = self._device_to_node[device]
-        node_key = self._node_key(node)
-        options = {"resources": {node_key: 1.0 / 10**4}}
-        return actor.options(**options).remote(*args, **kwargs)
+        node_key = self._device_node_key[device]
+        key = (name, node_key)
+        actor = self._actor_options_cache.get(key)
+        if actor is None:
+            options = {"resources": self._node_resources[node_key]}
+            actor = self._actors[name].options(**options)
+            self._actor_options_cache[key] = actor
+        return actor.remote(*args, **kwargs)
 
     def call_actor_method(self, actor, method: str, *args, **kwargs):
         return getattr(actor, method).remote(*args, **kwargs)
@@ -213,10 +287,12 @@ class RayBackendStockScheduler(RayBackend):
     by the caller. For testing only.
     """
 
+    def put(self, value: Any, device: Device):
+        return self._identity_remote.remote(value)
+
     def call(self, name: str, args, kwargs, device: Device, options: Dict):
         if device is not None:
-            node = self._device_to_node[device]
-            node_key = self._node_key(node)
+            node_key = self._device_node_key[device]
             if "resources" in options:
                 assert node_key not in options["resources"]
         return self._remote_functions[name].options(**options).remote(*args, **kwargs)
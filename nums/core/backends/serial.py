@@ -25,6 +25,7 @@ class SerialBackend(Backend):
         self.num_cpus = int(get_num_cores()) if num_cpus is None else num_cpus
         self._remote_functions: dict = {}
         self._actors: dict = {}
+        self._devices: List[Device] = [Device(0, "localhost", "cpu", 0)]
 
     def init(self):
         pass
@@ -42,7 +43,7 @@ class SerialBackend(Backend):
         return function
 
     def devices(self):
-        return [Device(0, "localhost", "cpu", 0)]
+        return self._devices
 
     def register(self, name: str, func: callable, remote_params: dict = None):
         if name in self._remote_functions:
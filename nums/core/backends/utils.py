@@ -17,13 +17,15 @@ import errno
 import inspect
 import socket
 import types
-from functools import wraps
+from functools import lru_cache, wraps
 import warnings
 
 import psutil
 import numpy as np
 
 
+# The number of physical cores does not change while the process runs.
+@lru_cache(maxsize=None)
 def get_num_cores(reserved_for_os=2):
     assert (
         reserved_for_os % 2 == 0
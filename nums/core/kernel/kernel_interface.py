@@ -53,7 +53,9 @@ class Kernel:
     def update_block(self, dst_arr, *src_arrs, src_params, dst_params, syskwargs: Dict):
         raise NotImplementedError()
 
-    def update_block_by_index(self, dst_arr, src_arr, index_pairs, syskwargs: Dict):
+    def update_block_by_index(
+        self, dst_arr, src_arr, index_pairs, inplace=False, *, syskwargs: Dict
+    ):
         raise NotImplementedError()
 
     def advanced_assign_block_along_axis(
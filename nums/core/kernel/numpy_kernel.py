@@ -27,6 +27,78 @@ from nums.core.grid.grid import ArrayGrid
 from nums.core.settings import np_ufunc_map
 
 
+# Functions used to create new blocks.
+block_ctors = {
+    "empty": np.empty,
+    "zeros": np.zeros,
+    "ones": np.ones,
+    "eye": np.eye,
+}
+
+# Binary ufuncs which are equivalent to reducing two stacked operands along axis 0.
+bop_reduce_ufuncs = {
+    "min": np.minimum,
+    "max": np.maximum,
+    "nanmin": np.fmin,
+    "nanmax": np.fmax,
+    "all": np.logical_and,
+    "alltrue": np.logical_and,
+    "any": np.logical_or,
+}
+
+# Arg reduction functions, paired with the comparison used to merge results across blocks.
+arg_ops = {
+    "argmin": (np.argmin, operator.lt),
+    "argmax": (np.argmax, operator.gt),
+}
+
+# Comparison ufuncs used to partition arrays about a pivot.
+pivot_ops = {
+    "gt": np.greater,
+    "lt": np.less,
+    "ge": np.greater_equal,
+    "le": np.less_equal,
+    "eq": np.equal,
+    "ne": np.not_equal,
+}
+
+# Chunks smaller than this are not summarized by tdigest_chunk.
+tdigest_min_chunk_size = 1024
+
+# Cache of NumPy functions resolved by name.
+np_funcs = {}
+
+# Cache of binary operator names resolved to NumPy or scipy.special functions.
+bop_funcs = {}
+
+
+def get_np_func(name):
+    func = np_funcs.get(name)
+    if func is None:
+        func = np_funcs[name] = getattr(np, name)
+    return func
+
+
+def get_bop_func(op):
+    func = bop_funcs.get(op)
+    if func is None:
+        name = np_ufunc_map.get(op, op)
+        func = getattr(np, name, None)
+        if func is None:
+            func = getattr(scipy.special, name)
+        bop_funcs[op] = func
+    return func
+
+
+def blas_compatible(arr):
+    # BLAS accepts C or F contiguous operands, which covers transposed blocks.
+    # Other strided layouts cause np.matmul to fall back to a slow non-BLAS loop,
+    # so copy these into a contiguous array unless they're small.
+    if arr.flags.c_contiguous or arr.flags.f_contiguous or arr.size < 4096:
+        return arr
+    return np.ascontiguousarray(arr)
+
+
 def block_rng(seed, jump_index):
     return Generator(PCG64(seed).jumped(jump_index))
 
@@ -49,6 +121,10 @@ class RNG(RNGInterface):
     # Blocks are sampled for new arrays by incrementing the jump index as before.
     # This can be viewed simply as incrementing the jump index whenever a new block needs to be
     # sampled, regardless of the array the block belongs to.
+    # PCG64.jumped is implemented with PCG64's advance, which takes time logarithmic in the
+    # jump distance, so creating a block's generator costs the same for any jump index.
+    # Switching to a counter-based generator such as Philox would not make seeking cheaper,
+    # and would change the values sampled for a given seed.
     # A global random state is maintained, just like in numpy, so that
     # a random state is not required to sample numbers.
     # The seed can be set for the global random state, which
@@ -90,7 +166,7 @@ class KernelCls(KernelImp):
         return isinstance(arr, np.ndarray)
 
     def new_block(self, op_name, grid_entry, grid_meta):
-        op_func = np.__getattribute__(op_name)
+        op_func = block_ctors[op_name]
         grid = ArrayGrid.from_meta(grid_meta)
         block_shape = grid.get_block_shape(grid_entry)
         if op_name == "eye":
@@ -105,7 +181,9 @@ class KernelCls(KernelImp):
         result = op_func(*rfunc_args).reshape(shape)
         if rfunc_name not in ("random", "integers"):
             # Only random and integer supports sampling of a specific type.
-            result = result.astype(dtype)
+            # Most samplers already produce the requested dtype (float64 by default),
+            # in which case no copy is made.
+            result = result.astype(dtype, copy=False)
         return result
 
     def permutation(self, rng_params, size):
@@ -147,10 +225,20 @@ class KernelCls(KernelImp):
                 dst_arr[dst_sel] = src_arr[src_sel]
         return dst_arr
 
-    def update_block_by_index(self, dst_arr, src_arr, index_pairs):
-        result = dst_arr.copy()
-        for dst_index, src_index in index_pairs:
-            result[tuple(dst_index)] = src_arr[tuple(src_index)]
+    def update_block_by_index(self, dst_arr, src_arr, index_pairs, inplace=False):
+        if inplace and dst_arr.flags.writeable:
+            result = dst_arr
+        else:
+            result = dst_arr.copy()
+        # Stack index pairs into (N, ndim) arrays and perform a single scatter,
+        # instead of indexing element by element.
+        dst_indices = np.array(
+            [dst_index for dst_index, _ in index_pairs], dtype=np.intp
+        )
+        src_indices = np.array(
+            [src_index for _, src_index in index_pairs], dtype=np.intp
+        )
+        result[tuple(dst_indices.T)] = src_arr[tuple(src_indices.T)]
         return result
 
     def advanced_select_block_along_axis(
@@ -176,19 +264,16 @@ class KernelCls(KernelImp):
 
         # Note that here, we only compute the set of indices that need to be updated for axis.
         # Slice and index subscript bounds are tested in the control process.
-        # This could be optimized, but in its current state, it's simple and not a bottleneck.
-        array = ss[src_axis]
-        dst_vec = np.arange(len(array))
-        dst_mask = (dst_coord[dst_axis] <= dst_vec) & (
-            dst_vec < dst_coord[dst_axis] + dst_arr_shape[dst_axis]
-        )
-        src_vec = np.array(array)
-        src_mask = (src_coord[src_axis] <= src_vec) & (
-            src_vec < src_coord[src_axis] + src_arr.shape[src_axis]
-        )
-        mask = dst_mask & src_mask
-        src_vec = src_vec[mask] - src_coord[src_axis]
-        dst_vec = dst_vec[mask] - dst_coord[dst_axis]
+        # Entry i of the index array is written to position i of the output axis,
+        # so the entries which fall within the dst block are a contiguous window
+        # of the index array. We only test src bounds on that window.
+        array = np.asarray(ss[src_axis])
+        dst_start = dst_coord[dst_axis]
+        window = array[dst_start : dst_start + dst_arr_shape[dst_axis]]
+        src_start = src_coord[src_axis]
+        src_stop = src_start + src_arr.shape[src_axis]
+        dst_vec = np.flatnonzero((src_start <= window) & (window < src_stop))
+        src_vec = window[dst_vec] - src_start
         if dst_vec.shape[0] == 0:
             # Nothing to do for this array.
             # Return input args.
@@ -288,41 +373,38 @@ class KernelCls(KernelImp):
         return np.arange(start, stop, step, dtype)
 
     def sum_reduce(self, *arrs):
-        return np.add.reduce(arrs)
+        # Accumulate into a single output array.
+        # np.add.reduce would first stack arrs into one large temporary array.
+        # The accumulator dtype matches np.add.reduce,
+        # which sums bool and small integer dtypes as the platform integer.
+        dtype = np.add.reduce(np.zeros(1, dtype=np.result_type(*arrs))).dtype
+        result = np.array(arrs[0], dtype=dtype)
+        for arr in arrs[1:]:
+            np.add(result, arr, out=result)
+        return result
 
     def reduce_axis(self, op_name, arr, axis, keepdims, transposed):
-        op_func = np.__getattribute__(op_name)
+        op_func = get_np_func(op_name)
         if transposed:
             arr = arr.T
-        if (
-            axis is not None
-            and arr.shape[axis] > 1
-            and op_name == "sum"
-            and not keepdims
-        ):
-            # We can optimize this with matmul or tensordot.
-            if len(arr.shape) == 2:
-                assert axis in (0, 1)
-                if axis == 0:
-                    return np.matmul(np.ones(arr.shape[0]), arr)
-                else:
-                    return np.matmul(arr, np.ones(arr.shape[1]))
-            else:
-                return np.tensordot(np.ones(arr.shape[axis]), arr, axes=(0, axis))
         return op_func(arr, axis=axis, keepdims=keepdims)
 
     # This is essentially a map.
     def map_uop(self, op_name, arr, args, kwargs):
-        ufunc = np.__getattribute__(op_name)
+        ufunc = get_np_func(op_name)
         return ufunc(arr, *args, **kwargs)
 
     def where(self, arr, x, y, block_slice_tuples):
         if x is None:
             assert y is None
-            res = np.where(arr)
-            for i, (start, stop) in enumerate(block_slice_tuples):
-                arr = res[i]
-                arr += start
+            if arr.ndim <= 1:
+                # flatnonzero avoids building a coordinate tuple for 1D masks.
+                res = (np.flatnonzero(arr),)
+            else:
+                res = np.nonzero(arr)
+            # Offset block-local coordinates in-place to obtain global coordinates.
+            for axis_coords, (start, _) in zip(res, block_slice_tuples):
+                np.add(axis_coords, start, out=axis_coords)
             shape = res[0].shape
             res = list(res)
             res.append(shape)
@@ -357,6 +439,10 @@ class KernelCls(KernelImp):
         return arr.size
 
     def tdigest_chunk(self, arr):
+        if arr.size < tdigest_min_chunk_size:
+            # Small chunks are returned as-is, and are added to the final digest
+            # with a single batched update in percentiles_from_tdigest.
+            return arr
         # pylint: disable = import-outside-toplevel
         from crick import TDigest
 
@@ -369,7 +455,12 @@ class KernelCls(KernelImp):
         from crick import TDigest
 
         t = TDigest()
-        t.merge(*digests)
+        chunks = [d for d in digests if isinstance(d, np.ndarray)]
+        digests = [d for d in digests if not isinstance(d, np.ndarray)]
+        if len(digests) > 0:
+            t.merge(*digests)
+        if len(chunks) > 0:
+            t.update(np.concatenate([c.ravel() for c in chunks]))
         return np.array(t.quantile(q))
 
     def select_median(self, arr):
@@ -377,6 +468,9 @@ class KernelCls(KernelImp):
         assert arr.ndim == 1, "Only 1D 'arr' is supported."
         if arr.size == 0:
             return 0  # Dummy value that has no effect on weighted median.
+        if arr.size == 1:
+            # Skip the copy made by np.partition.
+            return arr[0]
         index = arr.size // 2
         return np.partition(arr, index)[index]
 
@@ -398,16 +492,10 @@ class KernelCls(KernelImp):
         """Return all elements in `arr` for which the comparsion to `pivot` is True."""
         if arr.size == 0:
             return 0, arr
-        ops = {
-            "gt": operator.gt,
-            "lt": operator.lt,
-            "ge": operator.ge,
-            "le": operator.le,
-            "eq": operator.eq,
-            "ne": operator.ne,
-        }
-        assert op in ops, "'op' must be a valid comparison operator."
-        comp = arr[ops[op](arr, pivot)]
+        assert op in pivot_ops, "'op' must be a valid comparison operator."
+        # np.compress is a single pass over a 1D array,
+        # and is cheaper than boolean fancy indexing.
+        comp = np.compress(pivot_ops[op](arr, pivot), arr)
         return comp.size, comp
 
     def bop(self, op, a1, a2, a1_T, a2_T, axes):
@@ -416,17 +504,14 @@ class KernelCls(KernelImp):
         if a2_T:
             a2 = a2.T
         if op == "tensordot":
+            a1, a2 = blas_compatible(a1), blas_compatible(a2)
             if axes == 1 and max(len(a1.shape), len(a2.shape)) <= 2:
                 # Execute this as a matmul.
                 # TODO: Outer product is optimized.
                 #  detect here and execute np.outer(...)
                 return np.matmul(a1, a2)
             return np.tensordot(a1, a2, axes=axes)
-        op = np_ufunc_map.get(op, op)
-        try:
-            ufunc = np.__getattribute__(op)
-        except Exception as _:
-            ufunc = scipy.special.__getattribute__(op)
+        ufunc = get_bop_func(op)
         return ufunc(a1, a2)
 
     def bop_reduce(self, op, a1, a2, a1_T, a2_T):
@@ -440,20 +525,23 @@ class KernelCls(KernelImp):
             r = a1 + a2
         elif op == "prod":
             r = a1 * a2
+        elif op in bop_reduce_ufuncs:
+            # Apply the equivalent binary ufunc directly,
+            # which avoids stacking the operands into a temporary array.
+            r = bop_reduce_ufuncs[op](a1, a2)
         else:
-            reduce_op = np.__getattribute__(op)
+            reduce_op = get_np_func(op)
             a = np.stack([a1, a2], axis=0)
             r = reduce_op(a, axis=0, keepdims=False)
 
-        if a1 is np.nan or a2 is np.nan or r is np.nan:
-            assert np.isscalar(a1) and np.isscalar(a2) and np.isscalar(r)
-        else:
-            assert a1.shape == a2.shape == r.shape
+        assert np.shape(a1) == np.shape(a2) == np.shape(r)
         return r
 
     def qr(self, *arrays, mode="reduced", axis=None):
         if len(arrays) > 1:
             assert axis is not None
+            # In blocked QR (see nums.core.linalg), axis=0 stacks only small R factors,
+            # and axis=1 materializes one row of blocks, which the local QR needs anyway.
             arr = np.concatenate(arrays, axis=axis)
         else:
             arr = arrays[0]
@@ -473,11 +561,17 @@ class KernelCls(KernelImp):
     # Boolean
 
     def array_compare(self, func_name: str, a: np.ndarray, b: np.ndarray, args):
-        eq_func = getattr(np, func_name)
+        eq_func = get_np_func(func_name)
         if func_name == "allclose":
             assert len(args) == 2
             rtol = args[0]
             atol = args[1]
+            if a.shape == b.shape and a.size > 1024:
+                # Compare a strided sample of at most 1024 entries first,
+                # so that blocks which differ are usually detected without a full pass.
+                step = -(-a.size // 1024)
+                if not np.allclose(a.flat[::step], b.flat[::step], rtol, atol):
+                    return False
             return np.allclose(a, b, rtol, atol)
 
         assert len(args) == 0
@@ -486,25 +580,22 @@ class KernelCls(KernelImp):
     # Logic
 
     def logical_and(self, *bool_list):
-        return np.all(bool_list)
+        # Short-circuit on the first False value, and return a NumPy bool
+        # so the result remains a valid 0-dimensional block.
+        return np.bool_(all(bool_list))
 
     def arg_op(
         self, op_name, arr, block_slice, other_argoptima=None, other_optima=None
     ):
-        if op_name == "argmin":
-            arr_argmin = np.argmin(arr)
-            arr_min = arr[arr_argmin]
-            if other_optima is not None and other_optima < arr_min:
-                return other_argoptima, other_optima
-            return block_slice.start + arr_argmin, arr_min
-        elif op_name == "argmax":
-            arr_argmax = np.argmax(arr)
-            arr_max = arr[arr_argmax]
-            if other_optima is not None and other_optima > arr_max:
-                return other_argoptima, other_optima
-            return block_slice.start + arr_argmax, arr_max
-        else:
+        if op_name not in arg_ops:
             raise Exception("Unsupported arg op.")
+        arg_func, is_better = arg_ops[op_name]
+        # The optimum is read with a single element access at the returned index.
+        arr_argoptimum = arg_func(arr)
+        arr_optimum = arr[arr_argoptimum]
+        if other_optima is not None and is_better(other_optima, arr_optimum):
+            return other_argoptima, other_optima
+        return block_slice.start + arr_argoptimum, arr_optimum
 
     def reshape(self, arr, shape):
         return arr.reshape(shape)
@@ -12,8 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import time
-
+import psutil
 import pytest
 import ray
 
@@ -29,6 +28,13 @@ from nums.core.backends import Backend, SerialBackend, RayBackend, MPIBackend
 # pylint: disable=protected-access, import-outside-toplevel
 
 
+def wait_for_shutdown(timeout=2.0):
+    # Wait until processes started by Ray, such as the raylet and GCS server,
+    # have exited, instead of sleeping for a fixed duration.
+    # Returns immediately if no child processes remain.
+    psutil.wait_procs(psutil.Process().children(recursive=True), timeout=timeout)
+
+
 def pytest_collection_modifyitems(config, items):
     keywordexpr = config.option.keyword
     markexpr = config.option.markexpr
@@ -70,7 +76,7 @@ def nps_app_inst(request):
     if settings.backend_name == "ray":
         assert application_manager.instance().km.backend._manage_ray
     application_manager.destroy()
-    time.sleep(2)
+    wait_for_shutdown()
 
 
 @pytest.fixture(scope="module")
@@ -84,7 +90,7 @@ def app_inst(request):
         assert _app_inst.km.backend._manage_ray
     _app_inst.km.backend.shutdown()
     _app_inst.km.destroy()
-    time.sleep(2)
+    wait_for_shutdown()
 
 
 @pytest.fixture(scope="module", params=[("serial", "cyclic")])
@@ -94,7 +100,7 @@ def app_inst_s3(request):
     yield _app_inst
     _app_inst.km.backend.shutdown()
     _app_inst.km.destroy()
-    time.sleep(2)
+    wait_for_shutdown()
 
 
 @pytest.fixture(
@@ -113,7 +119,7 @@ def app_inst_all(request):
         assert _app_inst.km.backend._manage_ray
     _app_inst.km.backend.shutdown()
     _app_inst.km.destroy()
-    time.sleep(2)
+    wait_for_shutdown()
 
 
 def get_app(backend_name, device_grid_name="cyclic"):
@@ -33,6 +33,19 @@ def test_uops(app_inst: ArrayApplication):
     assert np.allclose(np.linalg.norm(np_x), app_inst.norm(ba_x).get())
 
 
+def test_sqrt(app_inst: ArrayApplication):
+    for np_x in [
+        np.arange(10),
+        np.arange(10, dtype=np.float16),
+        np.array([True, False]),
+        np.array([4 + 0j, 9 + 0j]),
+    ]:
+        ba_x = app_inst.array(np_x, block_shape=(3,))
+        ba_y = app_inst.sqrt(ba_x)
+        assert ba_y.dtype is np.float64
+        assert np.allclose(np.sqrt(np_x.real.astype(np.float64)), ba_y.get())
+
+
 def test_bops(app_inst: ArrayApplication):
     # pylint: disable=no-member
     pairs = [(1, 2), (2.0, 3.0), (2, 3.0), (2.0, 3)]
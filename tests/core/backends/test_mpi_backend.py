@@ -0,0 +1,261 @@
+# Copyright (C) 2020 NumS Development Team.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import shutil
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+from nums.core.backends import mpi
+
+
+# pylint: disable=import-outside-toplevel
+
+
+repo_root = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+
+
+def roundtrip(value, copy=False, readonly=False):
+    frames = mpi.serialize(value)
+    payload = np.empty(mpi.payload_nbytes(frames), dtype=np.uint8)
+    mpi.pack(frames, payload)
+    if readonly:
+        payload = bytes(payload)
+    return mpi.deserialize(payload, copy=copy), frames, payload
+
+
+def test_serialize_objects():
+    for value in [[], 3.5, np.float64(2.0), "s", {"a": (1, None)}]:
+        result, frames, _ = roundtrip(value)
+        assert len(frames) == 1
+        assert type(result) is type(value)
+        assert result == value
+
+
+def test_serialize_arrays():
+    c_arr = np.arange(24, dtype=np.float64).reshape(4, 6)
+    f_arr = np.asfortranarray(np.arange(24, dtype=np.int32).reshape(4, 6))
+    for arr in [c_arr, f_arr]:
+        for copy in [False, True]:
+            result, frames, payload = roundtrip(arr, copy=copy)
+            assert len(frames) == 2
+            assert result.dtype == arr.dtype
+            assert result.flags.f_contiguous == arr.flags.f_contiguous
+            assert np.array_equal(result, arr)
+            assert result.flags.writeable
+            assert np.shares_memory(result, payload) != copy
+            if not copy:
+                address = result.__array_interface__["data"][0]
+                base = payload.__array_interface__["data"][0]
+                assert (address - base) % mpi.FRAME_ALIGNMENT == 0
+
+
+def test_serialize_strided_array():
+    # Non-contiguous arrays are pickled in-band.
+    arr = np.arange(100, dtype=np.float64).reshape(10, 10)[:, ::3]
+    for copy in [False, True]:
+        result, frames, payload = roundtrip(arr, copy=copy)
+        assert len(frames) == 1
+        assert np.array_equal(result, arr)
+        assert result.flags.writeable
+        assert not np.shares_memory(result, payload)
+
+
+def test_serialize_mixed():
+    arr = np.arange(10, dtype=np.complex128)
+    value = {"a": arr, "b": [arr[::2], "s", 1], "c": np.ones((3, 2), dtype=bool)}
+    result, frames, _ = roundtrip(value)
+    assert len(frames) == 3
+    assert np.array_equal(result["a"], value["a"])
+    assert np.array_equal(result["b"][0], value["b"][0])
+    assert result["b"][1:] == ["s", 1]
+    assert np.array_equal(result["c"], value["c"])
+
+
+def test_serialize_readonly_payload():
+    arr = np.arange(10, dtype=np.float64)
+    result, _, _ = roundtrip(arr, copy=False, readonly=True)
+    assert np.array_equal(result, arr)
+    assert not result.flags.writeable
+    result, _, _ = roundtrip(arr, copy=True, readonly=True)
+    assert np.array_equal(result, arr)
+    assert result.flags.writeable
+
+
+def test_serialize_protocol_4(monkeypatch):
+    monkeypatch.setattr(mpi.sys, "version_info", (3, 7, 0))
+    value = {"a": np.arange(10, dtype=np.float64), "b": "s"}
+    result, frames, _ = roundtrip(value)
+    assert len(frames) == 1
+    assert np.array_equal(result["a"], value["a"])
+    assert result["a"].flags.writeable
+    assert result["b"] == "s"
+
+
+def run_mpi(tmp_path, script: str, num_ranks: int = 2):
+    # Run script on num_ranks MPI processes. The script should raise on failure.
+    pytest.importorskip("mpi4py")
+    mpiexec = shutil.which("mpiexec")
+    if mpiexec is None:
+        pytest.skip("mpiexec not found.")
+    script_path = tmp_path / "mpi_script.py"
+    script_path.write_text(textwrap.dedent(script))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([repo_root, env.get("PYTHONPATH", "")])
+    result = subprocess.run(
+        [mpiexec, "-n", str(num_ranks), sys.executable, str(script_path)],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        timeout=120,
+        check=False,
+    )
+    assert result.returncode == 0, result.stdout.decode()
+
+
+def test_call_large_pickled_args(tmp_path):
+    # Pickled arguments larger than the default receive buffer of a buffer-less irecv.
+    run_mpi(
+        tmp_path,
+        """
+        import numpy as np
+        from nums.core.backends import MPIBackend
+
+        def checksum(x):
+            if isinstance(x, str):
+                return len(x)
+            return float(np.asarray(x, dtype=np.float64).sum())
+
+        backend = MPIBackend()
+        backend.init()
+        backend.register("checksum", checksum, {})
+        src, dst = backend.devices()[0], backend.devices()[1]
+        values = [
+            np.arange(2000 * 1000, dtype=np.float64).reshape(2000, 1000)[:, ::2],
+            np.ones(100000, dtype=np.float16),
+            "s" * 300000,
+        ]
+        for use_async in (True, False):
+            backend._async = use_async
+            for value in values:
+                obj = backend.put(value, src)
+                result = backend.call("checksum", [obj], {}, dst, {})
+                assert backend.get(result) == checksum(value)
+                result = backend.call("checksum", [], {"x": obj}, dst, {})
+                assert backend.get(result) == checksum(value)
+        """,
+    )
+
+
+def test_call_many_senders(tmp_path):
+    # Arguments from several senders, with several arguments per sender.
+    run_mpi(
+        tmp_path,
+        """
+        import numpy as np
+        from nums.core.backends import MPIBackend
+
+        backend = MPIBackend()
+        backend.init()
+        backend.register("pack", lambda *args, **kwargs: (args, kwargs), {})
+        devices = backend.devices()
+        values = [
+            np.arange(10, dtype=np.float64),
+            "s" * 100000,
+            np.ones(10, dtype=np.float16),
+            np.arange(12, dtype=np.int64).reshape(3, 4),
+            {"a": 1},
+            np.arange(100000, dtype=np.float64)[::2],
+        ]
+        objs = [
+            backend.put(value, device) for value, device in zip(values, devices * 2)
+        ]
+        for use_async in (True, False):
+            backend._async = use_async
+            result = backend.call(
+                "pack", objs[:4], {"x": objs[4], "y": objs[5]}, devices[2], {}
+            )
+            args, kwargs = backend.get(result)
+            for value, arg in zip(values, list(args) + [kwargs["x"], kwargs["y"]]):
+                if isinstance(value, np.ndarray):
+                    assert arg.dtype == value.dtype
+                    assert np.array_equal(arg, value)
+                else:
+                    assert arg == value
+        """,
+        num_ranks=3,
+    )
+
+
+def test_get_many_roots(tmp_path):
+    # Get values from several roots, through the shared memory window and through Ibcast.
+    run_mpi(
+        tmp_path,
+        """
+        import numpy as np
+        from nums.core.backends import MPIBackend
+        from nums.core.backends.mpi import MPIRemoteObj
+
+        backend = MPIBackend()
+        backend.init()
+        devices = backend.devices()
+        values = [
+            np.arange(12, dtype=np.float64).reshape(3, 4),
+            np.arange(100, dtype=np.float64).reshape(10, 10)[:, ::3],
+            "s" * 100,
+            {"a": np.ones(5, dtype=np.int64), "b": 1},
+            np.asfortranarray(np.arange(12, dtype=np.int32).reshape(3, 4)),
+            2.5,
+        ]
+        assert backend._shared_memory
+        for shared in (True, False):
+            backend._shared_memory = shared
+            objs = [
+                backend.put(value.copy() if hasattr(value, "copy") else value, device)
+                for value, device in zip(values, devices * 2)
+            ]
+            results = backend.get(objs)
+            for value, result in zip(values, results):
+                if isinstance(value, dict):
+                    assert np.array_equal(result["a"], value["a"])
+                    assert result["b"] == value["b"]
+                elif isinstance(value, np.ndarray):
+                    assert np.array_equal(result, value)
+                else:
+                    assert result == value
+            # Mutate arrays received from other ranks.
+            received = [
+                (value, result)
+                for obj, value, result in zip(objs, values, results)
+                if isinstance(obj, MPIRemoteObj) and isinstance(value, np.ndarray)
+            ]
+            for _, result in received:
+                assert result.flags.writeable
+                result += backend.rank + 1
+            backend.comm.Barrier()
+            for value, result in received:
+                assert np.array_equal(result, value + backend.rank + 1)
+            for value, result in zip(values, backend.get(objs)):
+                if isinstance(value, np.ndarray):
+                    assert np.array_equal(result, value)
+        """,
+        num_ranks=3,
+    )
@@ -0,0 +1,127 @@
+# Copyright (C) 2020 NumS Development Team.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+
+from nums.core.kernel import numpy_kernel
+
+
+def test_percentiles_from_tdigest():
+    kernel = numpy_kernel.KernelCls()
+    rs = np.random.RandomState(1337)
+    # Chunks under tdigest_min_chunk_size are not summarized, and may differ in shape.
+    arrs = [
+        rs.random_sample((40, 50)),
+        rs.random_sample((3, 4)),
+        rs.random_sample((7,)),
+        rs.random_sample((2, 3, 2)),
+        rs.random_sample((2000,)),
+    ]
+    digests = [kernel.tdigest_chunk(arr) for arr in arrs]
+    assert sum(isinstance(d, np.ndarray) for d in digests) == 3
+    values = np.concatenate([arr.ravel() for arr in arrs])
+    assert kernel.percentiles_from_tdigest(0.0, *digests) == values.min()
+    assert kernel.percentiles_from_tdigest(1.0, *digests) == values.max()
+    assert np.isclose(
+        kernel.percentiles_from_tdigest(0.5, *digests), np.median(values), atol=0.01
+    )
+    # Only small chunks.
+    assert kernel.percentiles_from_tdigest(1.0, *digests[1:4]) == max(
+        arr.max() for arr in arrs[1:4]
+    )
+
+
+def test_update_block_by_index():
+    kernel = numpy_kernel.KernelCls()
+    src_arr = np.arange(6, dtype=np.float64).reshape(2, 3)
+    index_pairs = [([0, 0], [1, 2]), ([1, 1], [0, 1])]
+    expected = np.zeros((2, 2))
+    expected[0, 0], expected[1, 1] = 5, 1
+
+    # The copy is only skipped for writeable arrays with inplace=True.
+    dst_arr = np.zeros((2, 2))
+    result = kernel.update_block_by_index(dst_arr, src_arr, index_pairs)
+    assert np.array_equal(result, expected)
+    assert np.array_equal(dst_arr, np.zeros((2, 2)))
+
+    dst_arr.flags.writeable = False
+    result = kernel.update_block_by_index(dst_arr, src_arr, index_pairs, inplace=True)
+    assert np.array_equal(result, expected)
+    assert np.array_equal(dst_arr, np.zeros((2, 2)))
+
+    dst_arr = np.zeros((2, 2))
+    result = kernel.update_block_by_index(dst_arr, src_arr, index_pairs, inplace=True)
+    assert result is dst_arr
+    assert np.array_equal(dst_arr, expected)
+
+
+def test_update_block():
+    kernel = numpy_kernel.KernelCls()
+    dst_arr = np.zeros((2, 3))
+    src_arr = np.ones((2, 2))
+    src_params = [((slice(0, 2), slice(0, 2)), None, False)]
+    dst_params = [((slice(0, 2), slice(1, 3)), False)]
+    result = kernel.update_block(
+        dst_arr, src_arr, src_params=src_params, dst_params=dst_params
+    )
+    assert np.array_equal(result, [[0, 1, 1], [0, 1, 1]])
+    assert np.array_equal(dst_arr, np.zeros((2, 3)))
+
+
+def test_advanced_assign_block_along_axis():
+    kernel = numpy_kernel.KernelCls()
+    dst_arr = np.zeros((4, 2))
+    src_arr = np.ones((2, 2))
+    ss = ([0, 2], slice(0, 2))
+    result = kernel.advanced_assign_block_along_axis(
+        dst_arr, src_arr, ss, 0, (0, 0), (0, 0)
+    )
+    assert np.array_equal(result, [[1, 1], [0, 0], [1, 1], [0, 0]])
+    assert np.array_equal(dst_arr, np.zeros((4, 2)))
+
+
+def test_sum_reduce():
+    kernel = numpy_kernel.KernelCls()
+    for arrs in [
+        [np.ones(2, dtype=bool), np.ones(2, dtype=bool)],
+        [np.full(2, 100, dtype=np.int8), np.full(2, 100, dtype=np.int8)],
+        [np.ones(2, dtype=np.uint8), np.ones(2, dtype=np.float32)],
+        [np.arange(6, dtype=np.float64).reshape(2, 3)] * 3,
+        [np.int32(2), np.float64(3.5)],
+    ]:
+        expected = np.add.reduce(arrs)
+        result = kernel.sum_reduce(*arrs)
+        assert result.dtype == expected.dtype
+        assert np.array_equal(result, expected)
+
+
+def test_array_compare_allclose():
+    kernel = numpy_kernel.KernelCls()
+    for size in [10, 1025, 2047, 5000]:
+        a = np.arange(size, dtype=np.float64)
+        assert kernel.array_compare("allclose", a, a.copy(), (1e-05, 1e-08))
+        # Differences outside of the strided sample are detected by the full pass.
+        b = a.copy()
+        b[1] += 1
+        assert not kernel.array_compare("allclose", a, b, (1e-05, 1e-08))
+
+
+if __name__ == "__main__":
+    test_percentiles_from_tdigest()
+    test_update_block_by_index()
+    test_update_block()
+    test_advanced_assign_block_along_axis()
+    test_sum_reduce()
+    test_array_compare_allclose()
@@ -65,16 +65,11 @@ def check_block_integrity(arr: BlockArray):
 class MockMultiNodeRayBackend(RayBackend):
     def mock_devices(self, num_nodes):
         assert len(self._available_nodes) == 1
-        src_node = self._available_nodes[0]
-        src_node_key = self._node_key(src_node)
+        # Generate distinct device ids, but map them all to the same actual node.
+        # When the function is invoked, the device id will map to the actual node.
         self._num_nodes = num_nodes
-        self._devices = []
-        for node_id in range(self._num_nodes):
-            # Generate distinct device ids, but map them all to the same actual node.
-            # When the function is invoked, the device id will map to the actual node.
-            did = Device(node_id, src_node_key, "cpu", 0)
-            self._devices.append(did)
-            self._device_to_node[did] = src_node
+        self._available_nodes = self._available_nodes * num_nodes
+        self.init_devices()
 
 
 class MockMultiNodeDaskBackend(DaskBackend):